@@ -1,12 +1,18 @@
+import argparse
+import json
 import os
 import subprocess
+import threading
 import time
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-
-
-
-
+# Optional: on Linux, wake up as soon as the output file is written instead of sleeping blindly
+# (install: pip install inotify_simple)
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
 
 
 # Directory where this script lives (probably .../PWT-Simulation-Tournament/Data)
@@ -19,45 +25,226 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 EXPECTED_BATTLES = 1  # or 2628 for full 73-trainer tournament
 MAX_ITERATIONS = 100
 
+# Retry delay after a failed run: 1s, 2s, 4s, ... capped at 30s
+BACKOFF_BASE = 1
+BACKOFF_CAP = 30
+
+# How long to wait for the output file to be written after the simulation exits
+OUTPUT_SETTLE_TIMEOUT = 2
+
+# Set on Ctrl+C so queued/backing-off iterations don't start new runs
+stop_requested = threading.Event()
+
+BATTLE_END_MARKER = b"]]]]]\n"
+READ_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Remembers outputs already found complete: filename -> [size, mtime_ns, battles counted]
+MANIFEST_NAME = ".valid_manifest.json"
+valid_manifest = None
+manifest_lock = threading.Lock()
+
+def manifest_path():
+    return os.path.join(OUTPUT_DIR, MANIFEST_NAME)
+
+def get_manifest():
+    global valid_manifest
+    with manifest_lock:
+        if valid_manifest is None:
+            try:
+                with open(manifest_path(), 'r', encoding="utf-8") as f:
+                    valid_manifest = json.load(f)
+            except (OSError, ValueError):
+                valid_manifest = {}
+        return valid_manifest
+
+def save_manifest():
+    manifest = get_manifest()
+    with manifest_lock:
+        data = json.dumps(manifest, indent=2, sort_keys=True)
+
+    # Write to a temp file and swap it in so a crash never leaves a half-written manifest
+    tmp_path = manifest_path() + ".tmp"
+    with open(tmp_path, 'w', encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, manifest_path())
+
+def count_battles(path, stop_at):
+    # Stream the file in binary chunks instead of decoding it all into one string.
+    # The last few bytes of each chunk are carried over so a marker split across
+    # two reads is still counted.
+    overlap = len(BATTLE_END_MARKER) - 1
+    hits = 0
+    tail = b""
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(READ_CHUNK_SIZE)
+            if not buf:
+                break
+            window = tail + buf
+            hits += window.count(BATTLE_END_MARKER)
+            if hits >= stop_at:
+                break
+            tail = window[-overlap:]
+    return hits
+
 def is_output_valid(path, min_battles):
     if not os.path.exists(path):
         return False
-    with open(path, 'r', encoding="utf-8") as f:
-        content = f.read()
-    return content.count("]]]]]\n") >= min_battles
+    st = os.stat(path)
+    # Too small to possibly hold enough end markers
+    if st.st_size < min_battles * len(BATTLE_END_MARKER):
+        return False
+
+    # Unchanged since it was last found complete -> no need to read it again
+    manifest = get_manifest()
+    name = os.path.basename(path)
+    key = [st.st_size, st.st_mtime_ns]
+    with manifest_lock:
+        cached = manifest.get(name)
+    if cached and cached[:2] == key and cached[2] >= min_battles:
+        return True
+
+    hits = count_battles(path, min_battles)
+    if hits < min_battles:
+        return False
+
+    with manifest_lock:
+        manifest[name] = key + [hits]
+    return True
 
-def run_simulation_script(output_path):
+def run_simulation_script(output_path, worker_prefix="", skip_build=False):
     print(f"🔁 Running tournament iteration, output -> {output_path}")
 
     # Path to runSimulations.py (assumes it's in the same folder as this script)
     run_sim_path = os.path.join(BASE_DIR, "runSimulations.py")
 
+    # Concurrent runs need their own WorkerFiles/WorkerOutputs scratch names
+    env = dict(os.environ, PWT_WORKER_PREFIX=worker_prefix)
+    if skip_build:
+        env["PWT_SKIP_BUILD"] = "1"
+
     # Use the SAME Python that is running this script
     subprocess.run(
         [sys.executable, run_sim_path, output_path],
-        check=False  # set True if you want it to crash on error
+        check=False,  # set True if you want it to crash on error
+        env=env,
     )
 
-def main_loop():
+def build_simulator():
+    """Build pokemon-showdown once up front so concurrent runs don't rebuild it over each other."""
+    print("🔨 Building pokemon-showdown...")
+    subprocess.run(
+        ["node", "build"],
+        cwd=os.path.join(BASE_DIR, "..", "pokemon-showdown"),
+        check=False,
+    )
+
+def backoff_delay(consecutive_failures):
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** consecutive_failures)
+
+def open_output_watcher():
+    """Watch OUTPUT_DIR for finished writes, or return None if inotify isn't available."""
+    if INotify is None:
+        return None
+    try:
+        watcher = INotify()
+        watcher.add_watch(OUTPUT_DIR, flags.CLOSE_WRITE)
+    except OSError:
+        return None
+    return watcher
+
+def wait_for_output(watcher, output_path, timeout):
+    """Block until output_path is closed after writing, or until timeout seconds pass."""
+    if watcher is None:
+        time.sleep(timeout)
+        return
+
+    target = os.path.basename(output_path)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        for event in watcher.read(timeout=int(remaining * 1000)):
+            if event.name == target:
+                return
+
+def run_iteration(output_path, worker_prefix, skip_build, delay=0):
+    """Run one tournament into output_path (after an optional backoff delay) and report whether it completed."""
+    if delay:
+        print(f"⏳ Waiting {delay}s before retrying {output_path}...")
+        if stop_requested.wait(delay):
+            return False
+    if stop_requested.is_set():
+        return False
+
+    watcher = open_output_watcher()
+    try:
+        run_simulation_script(output_path, worker_prefix, skip_build)
+        wait_for_output(watcher, output_path, OUTPUT_SETTLE_TIMEOUT)
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+    return is_output_valid(output_path, EXPECTED_BATTLES)
+
+def main_loop(jobs=1):
     base_name = "output"
     extension = ".txt"
 
-    current_iteration = 0
-    while current_iteration < MAX_ITERATIONS:
-        next_output_file = os.path.join(
-            OUTPUT_DIR,
-            f"{base_name}{current_iteration + 1}{extension}"
-        )
-
-        if not is_output_valid(next_output_file, EXPECTED_BATTLES):
-            print(f"⛔ {next_output_file} missing or incomplete (< {EXPECTED_BATTLES} battles). Retrying simulation...")
-            run_simulation_script(next_output_file)
-            time.sleep(2)
+    # Every iteration writes its own outputN.txt, so all missing ones can run side by side
+    pending = []
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        output_file = os.path.join(OUTPUT_DIR, f"{base_name}{iteration}{extension}")
+        if is_output_valid(output_file, EXPECTED_BATTLES):
+            print(f"✅ {output_file} already complete.")
         else:
-            print(f"✅ {next_output_file} complete. Proceeding to next iteration.")
-            current_iteration += 1
+            print(f"⛔ {output_file} missing or incomplete (< {EXPECTED_BATTLES} battles). Queued for simulation.")
+            pending.append((iteration, output_file))
+    save_manifest()
+
+    jobs = max(1, min(jobs, len(pending)))
+    concurrent = jobs > 1
+    if concurrent:
+        build_simulator()
+
+    consecutive_failures = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        def submit(iteration, output_file, delay=0):
+            worker_prefix = f"i{iteration}-" if concurrent else ""
+            return executor.submit(run_iteration, output_file, worker_prefix, concurrent, delay)
+
+        futures = {submit(i, path): (i, path) for i, path in pending}
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    iteration, output_file = futures.pop(future)
+                    if future.result():
+                        save_manifest()
+                        print(f"✅ {output_file} complete.")
+                        consecutive_failures.pop(iteration, None)
+                        continue
+
+                    delay = backoff_delay(consecutive_failures.get(iteration, 0))
+                    consecutive_failures[iteration] = consecutive_failures.get(iteration, 0) + 1
+                    print(f"⛔ {output_file} still incomplete ({consecutive_failures[iteration]} failed run(s)). Retrying simulation...")
+                    futures[submit(iteration, output_file, delay)] = (iteration, output_file)
+        except BaseException:
+            # Ctrl+C (or any error): drop queued iterations and wake retries sleeping in backoff
+            stop_requested.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
 
     print(f"🎉 All {MAX_ITERATIONS} iterations complete. Wrapper exiting.")
 
 if __name__ == "__main__":
-    main_loop()
+    ap = argparse.ArgumentParser(description="Run tournament iterations until every output file is complete.")
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="Iterations to simulate at once (default: half the CPU cores, leaving room for the simulator).",
+    )
+    args = ap.parse_args()
+    main_loop(jobs=args.jobs)
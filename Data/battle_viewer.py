@@ -2,13 +2,21 @@
 from __future__ import annotations
 
 import argparse
+import json
+import os
 import re
 from collections import Counter
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Iterator, Optional, Tuple
 
+try:
+    import mmap
+except ImportError:  # some platforms (e.g. WASI) don't ship mmap
+    mmap = None
+
 # ---- dependency (install: pip install pokemon-showdown-replays) ----
 try:
     from pokemon_showdown_replays import Download, Replay
@@ -22,6 +30,20 @@ except Exception as e:
 
 START = "[[[[["
 END = "]]]]]"
+START_B = START.encode()
+END_B = END.encode()
+
+# One [[[[[ ... ]]]]] block; markers must sit on their own line (surrounding spaces allowed)
+BLOCK_RE = re.compile(
+    rb"^[^\S\n]*\[{5}[^\S\n]*$(.*?)^[^\S\n]*\]{5}[^\S\n]*$",
+    re.MULTILINE | re.DOTALL,
+)
+
+INDEX_SUFFIX = ".idx"  # output1.txt -> output1.txt.idx
+
+REPLAY_TIMESTAMP_FORMAT = "%a %b %d %Y %H:%M:%S"
+
+ROOMID_STRIP_RE = re.compile(r"[^a-z0-9]+")
 
 
 @dataclass
@@ -31,101 +53,177 @@ class BattleBlock:
 
 
 # ---------------- parsing battles from output1.txt ----------------
-def iter_battles_marked(path: Path) -> Iterator[BattleBlock]:
-    """Parse battles in [[[[[ ... ]]]]] blocks: first non-empty line is header, then protocol lines."""
-    in_block = False
-    waiting_for_header = False
-    header: Optional[str] = None
-    protocol_lines: list[str] = []
-
-    with path.open("r", encoding="utf-8", errors="replace") as f:
-        for raw in f:
-            line = raw.rstrip("\n")
-
-            if not in_block:
-                if line.strip() == START:
-                    in_block = True
-                    waiting_for_header = True
-                    header = None
-                    protocol_lines = []
-                continue
-
-            # inside a block
-            if line.strip() == END:
-                yield BattleBlock(header or "UNKNOWN_MATCHUP", protocol_lines)
-                in_block = False
-                waiting_for_header = False
-                header = None
-                protocol_lines = []
-                continue
-
-            if waiting_for_header:
-                if line.strip():
-                    header = line.strip()
-                    waiting_for_header = False
-                continue
-
-            if line.startswith("|"):
-                protocol_lines.append(line)
+@contextmanager
+def open_battle_file(path: Path):
+    """Yield the file's bytes: memory-mapped where possible, read into memory otherwise."""
+    with path.open("rb") as f:
+        if mmap is None or os.fstat(f.fileno()).st_size == 0:  # can't mmap an empty file
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
 
 
-def parse_single_battle_fallback(path: Path) -> BattleBlock:
+def has_markers(buf) -> bool:
+    return buf.find(START_B) != -1 and buf.find(END_B) != -1
+
+
+def find_header(buf, start: int, end: int, skip_protocol: bool = False) -> Tuple[str, int]:
+    """
+    First non-empty line of buf[start:end] (skipping '|' lines if skip_protocol),
+    decoded, plus the offset just past it. Nothing after the header is touched.
+    """
+    pos = start
+    while pos < end:
+        nl = buf.find(b"\n", pos, end)
+        if nl == -1:
+            nl = end
+        line = buf[pos:nl].rstrip(b"\r")
+        if line.strip() and not (skip_protocol and line.startswith(b"|")):
+            return line.strip().decode("utf-8", errors="replace"), nl + 1
+        pos = nl + 1
+    return "UNKNOWN_MATCHUP", end
+
+
+def protocol_lines_in(buf, start: int, end: int) -> list[str]:
+    """Decode only the lines of buf[start:end] that start with '|'."""
+    return [ln.decode("utf-8", errors="replace") for ln in buf[start:end].splitlines() if ln.startswith(b"|")]
+
+
+def parse_block(buf, start: int, end: int) -> BattleBlock:
+    """Parse the bytes between the markers: first non-empty line is header, then protocol lines."""
+    header, body_start = find_header(buf, start, end)
+    return BattleBlock(header, protocol_lines_in(buf, body_start, end))
+
+
+def iter_blocks(buf) -> Iterator[BattleBlock]:
+    """Let the regex engine jump between [[[[[ ... ]]]]] blocks and parse each one."""
+    for m in BLOCK_RE.finditer(buf):
+        yield parse_block(buf, m.start(1), m.end(1))
+
+
+def parse_fallback(buf) -> BattleBlock:
     """
     If file isn't marker-wrapped, treat it as one battle:
     - header = first non-empty non-protocol line (or UNKNOWN_MATCHUP)
     - protocol = all lines starting with '|'
     """
-    header = None
-    protocol_lines: list[str] = []
+    header, _ = find_header(buf, 0, len(buf), skip_protocol=True)
+    return BattleBlock(header, protocol_lines_in(buf, 0, len(buf)))
+
+
+def iter_battles_marked(path: Path) -> Iterator[BattleBlock]:
+    """Parse battles in [[[[[ ... ]]]]] blocks: first non-empty line is header, then protocol lines."""
+    with open_battle_file(path) as buf:
+        yield from iter_blocks(buf)
 
-    with path.open("r", encoding="utf-8", errors="replace") as f:
-        for raw in f:
-            line = raw.rstrip("\n")
-            if not line.strip():
-                continue
-            if header is None and not line.startswith("|"):
-                header = line.strip()
-                continue
-            if line.startswith("|"):
-                protocol_lines.append(line)
 
-    return BattleBlock(header or "UNKNOWN_MATCHUP", protocol_lines)
+def parse_single_battle_fallback(path: Path) -> BattleBlock:
+    with open_battle_file(path) as buf:
+        return parse_fallback(buf)
 
 
 def iter_battles(path: Path) -> Iterator[BattleBlock]:
-    # Peek once to decide if marker format exists
-    text = path.read_text(encoding="utf-8", errors="replace")
-    if START in text and END in text:
-        # re-read streaming for memory safety
-        yield from iter_battles_marked(path)
-    else:
-        yield parse_single_battle_fallback(path)
+    # One mapping serves both the marker check and the parse
+    with open_battle_file(path) as buf:
+        if has_markers(buf):
+            yield from iter_blocks(buf)
+        else:
+            yield parse_fallback(buf)
+
+
+# ---------------- random access via a block index ----------------
+def build_index(path: Path) -> list[tuple[str, int, int]]:
+    """One pass over the file recording (header, body_start, body_end) for every marked block."""
+    with open_battle_file(path) as buf:
+        return [(find_header(buf, m.start(1), m.end(1))[0], m.start(1), m.end(1)) for m in BLOCK_RE.finditer(buf)]
+
+
+def load_index(path: Path) -> list[tuple[str, int, int]]:
+    """
+    Return the block index for path, reusing output1.txt.idx if the file hasn't changed
+    (same size + mtime) and rebuilding it otherwise.
+    """
+    st = path.stat()
+    key = [st.st_size, st.st_mtime_ns]
+    index_path = path.with_name(path.name + INDEX_SUFFIX)
+
+    try:
+        with index_path.open("r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["key"] == key:
+            return [(header, start, end) for header, start, end in cached["entries"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # missing, stale format, or corrupt -> rebuild
+
+    entries = build_index(path)
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    try:
+        tmp_path.write_text(json.dumps({"key": key, "entries": entries}), encoding="utf-8")
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass  # read-only folder: still works, just without the cache
+
+    return entries
+
+
+def read_block(path: Path, start: int, end: int) -> BattleBlock:
+    with path.open("rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return parse_block(data, 0, len(data))
 
 
 def get_battle_by_index(path: Path, index: int) -> BattleBlock:
-    for i, block in enumerate(iter_battles(path)):
-        if i == index:
-            return block
-    raise IndexError(f"Battle index {index} out of range.")
+    with open_battle_file(path) as buf:
+        if not has_markers(buf):
+            if index == 0:
+                return parse_fallback(buf)
+            raise IndexError(f"Battle index {index} out of range.")
+
+    entries = load_index(path)
+    if not 0 <= index < len(entries):
+        raise IndexError(f"Battle index {index} out of range.")
+    _, start, end = entries[index]
+    return read_block(path, start, end)
 
 
 def get_battle_by_matchup(path: Path, matchup: str, occurrence: int = 0) -> BattleBlock:
     target = matchup.strip().lower()
-    hits = 0
-    for block in iter_battles(path):
-        if block.header.strip().lower() == target:
-            if hits == occurrence:
+
+    with open_battle_file(path) as buf:
+        if not has_markers(buf):
+            block = parse_fallback(buf)
+            if occurrence == 0 and block.header.strip().lower() == target:
                 return block
-            hits += 1
-    raise ValueError(f'No matchup "{matchup}" found at occurrence {occurrence}.')
+            raise ValueError(f'No matchup "{matchup}" found at occurrence {occurrence}.')
+
+    hdr_to_offsets: dict[str, list[Tuple[int, int]]] = {}
+    for header, start, end in load_index(path):
+        hdr_to_offsets.setdefault(header.strip().lower(), []).append((start, end))
+
+    offsets = hdr_to_offsets.get(target, [])
+    if not 0 <= occurrence < len(offsets):
+        raise ValueError(f'No matchup "{matchup}" found at occurrence {occurrence}.')
+    start, end = offsets[occurrence]
+    return read_block(path, start, end)
+
+
+def iter_headers(path: Path) -> Iterator[str]:
+    """Yield each battle's header without building its protocol lines."""
+    with open_battle_file(path) as buf:
+        if not has_markers(buf):
+            # Unmarked file is a single battle
+            yield find_header(buf, 0, len(buf), skip_protocol=True)[0]
+            return
+
+    for header, _, _ in load_index(path):
+        yield header
 
 
 def list_matchups(path: Path, top_n: int = 80) -> None:
-    counts = Counter()
-    total = 0
-    for block in iter_battles(path):
-        counts[block.header] += 1
-        total += 1
+    counts = Counter(iter_headers(path))
+    total = sum(counts.values())
 
     if total == 0:
         print("No battles found.")
@@ -153,7 +251,7 @@ def override_players(
     out = protocol_lines[:]
 
     def fix_player_line(line: str, name: Optional[str], avatar: Optional[str]) -> str:
-        parts = line.split("|")  # ["", "player", "p1", "Name", "Avatar", ...]
+        parts = line.split("|", 5)  # ["", "player", "p1", "Name", "Avatar", rest]
         while len(parts) < 6:
             parts.append("")
         if name is not None:
@@ -172,13 +270,11 @@ def override_players(
         elif ln.startswith("|player|p2|"):
             out[i] = fix_player_line(ln, p2_name, p2_avatar)
             found_p2 = True
+        if found_p1 and found_p2:
+            break  # each player is only declared once, no need to walk the rest of the log
 
     # Insert near the top (before |start| if possible)
-    insert_at = 0
-    for i, ln in enumerate(out):
-        if ln.startswith("|start|"):
-            insert_at = i
-            break
+    insert_at = next((i for i, ln in enumerate(out) if ln.startswith("|start|")), 0)
 
     if not found_p1 and (p1_name is not None or p1_avatar is not None):
         name = p1_name or "p1"
@@ -195,7 +291,7 @@ def override_players(
 
 def sanitize_roomid(s: str, fallback: str = "sim") -> str:
     s = s.strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "", s)
+    s = ROOMID_STRIP_RE.sub("", s)
     return (s or fallback)[:64]
 
 
@@ -203,6 +299,9 @@ def sanitize_roomid(s: str, fallback: str = "sim") -> str:
 def build_replay_object(protocol_lines: list[str], roomid: str, show_full_damage: bool) -> dict:
     """
     Convert protocol lines to the replay JSON object expected by pokemon_showdown_replays.
+
+    protocol_lines is handed to the library as-is (plus a trailing empty line), not copied,
+    so pass a list you don't need afterwards (override_players already returns a fresh one).
     """
     p1 = "p1"
     p2 = "p2"
@@ -226,14 +325,20 @@ def build_replay_object(protocol_lines: list[str], roomid: str, show_full_damage
             # Commonly unix seconds; best-effort conversion
             try:
                 epoch = int(ln.split("|")[2])
-                ts = datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%a %b %d %Y %H:%M:%S")
+                ts = datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(REPLAY_TIMESTAMP_FORMAT)
             except Exception:
                 ts = None
 
+        # Everything we need sits in the first few lines of the log; don't walk the whole battle
+        if p1 != "p1" and p2 != "p2" and fmt != "Custom Game" and ts is not None:
+            break
+
     if ts is None:
-        ts = datetime.now(timezone.utc).strftime("%a %b %d %Y %H:%M:%S")
+        ts = datetime.now(timezone.utc).strftime(REPLAY_TIMESTAMP_FORMAT)
 
-    log_lines = protocol_lines[:] + [""]  # library expects last line empty
+    log_lines = protocol_lines
+    if not log_lines or log_lines[-1] != "":
+        log_lines.append("")  # library expects last line empty
 
     log_dict = {
         "p1": p1,
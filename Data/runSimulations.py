@@ -77,20 +77,25 @@ else:
 
 print(f"Writing to {output_filename}")
 
+# Prefix for WorkerFiles/WorkerOutputs names so concurrent runs (auto_rerun_wrapper --jobs) don't collide
+worker_prefix = os.environ.get("PWT_WORKER_PREFIX", "")
+
 # Clear previous worker outputs
-infiles = [str(i + 1) for i in range(noOfThreads)] + ["0"]
+infiles = [worker_prefix + str(i + 1) for i in range(noOfThreads)] + [worker_prefix + "0"]
 for i in infiles:
     with open(f"./WorkerOutputs/{i}.txt", "w") as output:
         output.truncate(0)
 
-subprocess.getoutput("cd ../pokemon-showdown && node build")
+# The wrapper builds once itself when running several tournaments at the same time
+if not os.environ.get("PWT_SKIP_BUILD"):
+    subprocess.getoutput("cd ../pokemon-showdown && node build")
 threads = []
 start = time.time()
 
 # Parallel battle execution in chunks
 while len(teams) >= noOfThreads:
     for i in range(noOfThreads):
-        thread = threading.Thread(target=runSimulation, args=(teams[0], str(i+1), filename, teamNumbers))
+        thread = threading.Thread(target=runSimulation, args=(teams[0], worker_prefix + str(i+1), filename, teamNumbers))
         threads.append(thread)
         teams.pop(0)
 
@@ -103,7 +108,7 @@ while len(teams) >= noOfThreads:
 
 while len(teams) >= 25:
     for i in range(25):
-        thread = threading.Thread(target=runSimulation, args=(teams[0], str(i+1), filename, teamNumbers))
+        thread = threading.Thread(target=runSimulation, args=(teams[0], worker_prefix + str(i+1), filename, teamNumbers))
         threads.append(thread)
         teams.pop(0)
 
@@ -116,7 +121,7 @@ while len(teams) >= 25:
 
 while len(teams) >= 10:
     for i in range(10):
-        thread = threading.Thread(target=runSimulation, args=(teams[0], str(i+1), filename, teamNumbers))
+        thread = threading.Thread(target=runSimulation, args=(teams[0], worker_prefix + str(i+1), filename, teamNumbers))
         threads.append(thread)
         teams.pop(0)
 
@@ -129,7 +134,7 @@ while len(teams) >= 10:
 
 # Final leftover battles
 for battle in teams:
-    runSimulation(battle, "0", filename, teamNumbers)
+    runSimulation(battle, worker_prefix + "0", filename, teamNumbers)
 
 end = time.time()
 